@@ -1,22 +1,42 @@
-from fastapi import APIRouter, Depends, UploadFile, File, Form, HTTPException
-from pydantic import BaseModel
+from fastapi import APIRouter, BackgroundTasks, Depends, UploadFile, File, Form, HTTPException
+from pydantic import BaseModel, Field
+from sqlalchemy import Integer, bindparam, select, text
 from sqlalchemy.orm import Session
 from pathlib import Path
 from uuid import uuid4
+import shutil
 
 from app.core.config import settings
-from app.db.session import get_db
+from app.db.session import get_db, pgvector_has_iterative_scan
 from app.db.models import Document, Chunk
 
-from app.services.parsing import parse_file
-from app.services.chunking import chunk_pages
-from app.services.embeddings import embed_passages, embed_query
+from app.services.embeddings import embed_query
+from app.services.ingest import process_document
 from app.services.fallback_answer import build_fallback_answer
 
 router = APIRouter()
 
 STORAGE_DIR = Path("storage")
 
+# "loose index scan": mỗi bước nhảy tới collection_id kế tiếp qua btree index
+# => O(số collection) lần lookup thay vì quét cả bảng documents như SELECT DISTINCT
+_DISTINCT_COLLECTIONS_SQL = text(
+    """
+    WITH RECURSIVE t AS (
+        (SELECT collection_id FROM documents ORDER BY collection_id LIMIT 1)
+        UNION ALL
+        SELECT (
+            SELECT d.collection_id FROM documents d
+            WHERE d.collection_id > t.collection_id
+            ORDER BY d.collection_id LIMIT 1
+        )
+        FROM t
+        WHERE t.collection_id IS NOT NULL
+    )
+    SELECT collection_id FROM t WHERE collection_id IS NOT NULL
+    """
+)
+
 
 @router.get("/health")
 def health():
@@ -25,7 +45,7 @@ def health():
 
 @router.get("/collections")
 def list_collections(db: Session = Depends(get_db)):
-    rows = db.query(Document.collection_id).distinct().all()
+    rows = db.execute(_DISTINCT_COLLECTIONS_SQL).all()
     return {"collections": [r[0] for r in rows]}
 
 
@@ -39,12 +59,27 @@ def list_documents(collection_id: str = "default", db: Session = Depends(get_db)
     )
     return {
         "collection_id": collection_id,
-        "documents": [{"id": d.id, "filename": d.filename} for d in docs],
+        "documents": [{"id": d.id, "filename": d.filename, "status": d.status} for d in docs],
+    }
+
+
+@router.get("/documents/{document_id}")
+def get_document(document_id: int, db: Session = Depends(get_db)):
+    doc = db.get(Document, document_id)
+    if doc is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return {
+        "id": doc.id,
+        "filename": doc.filename,
+        "collection_id": doc.collection_id,
+        "status": doc.status,
+        "error": doc.error,
     }
 
 
-@router.post("/documents/upload")
+@router.post("/documents/upload", status_code=202)
 def upload_document(
+    background_tasks: BackgroundTasks,
     collection_id: str = Form("default"),
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
@@ -56,60 +91,81 @@ def upload_document(
     if ext not in [".pdf", ".docx", ".txt", ".md"]:
         raise HTTPException(status_code=400, detail=f"Unsupported file type: {ext}")
 
-    STORAGE_DIR.mkdir(parents=True, exist_ok=True)
     safe_name = f"{uuid4().hex}_{Path(file.filename).name}"
     save_path = STORAGE_DIR / safe_name
 
-    data = file.file.read()
-    save_path.write_bytes(data)
+    # stream thẳng xuống disk theo block 1MB, không giữ cả file trong RAM
+    with save_path.open("wb") as out:
+        shutil.copyfileobj(file.file, out, length=1024 * 1024)
 
-    try:
-        pages = parse_file(save_path)
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"Parse failed: {e}")
-
-    if not pages:
-        raise HTTPException(status_code=400, detail="No extractable text found")
-
-    chunks = chunk_pages(pages, chunk_chars=1200, overlap=200)
-    if not chunks:
-        raise HTTPException(status_code=400, detail="Chunking produced no chunks")
-
-    texts = [c["content"] for c in chunks]
-    vectors = embed_passages(texts)
-
-    doc = Document(collection_id=collection_id, filename=file.filename)
+    doc = Document(collection_id=collection_id, filename=file.filename, status="pending")
     db.add(doc)
-    db.flush()
-
-    chunk_rows = []
-    for i, c in enumerate(chunks):
-        chunk_rows.append(
-            Chunk(
-                document_id=doc.id,
-                collection_id=collection_id,
-                content=c["content"],
-                page=c["page"],
-                chunk_index=c["chunk_index"],
-                embedding=vectors[i],
-            )
-        )
-
-    db.add_all(chunk_rows)
     db.commit()
 
+    # parse/chunk/embed chạy sau khi trả response => không giữ HTTP connection trong lúc embed
+    background_tasks.add_task(process_document, doc.id, save_path, collection_id)
+
     return {
         "document_id": doc.id,
         "filename": file.filename,
         "collection_id": collection_id,
-        "chunks_indexed": len(chunk_rows),
+        "status": doc.status,
     }
 
 
+def _build_chat_stmt():
+    # Get both chunks + cosine distance for gating.
+    # Vector đã normalize => `<#>` (= -inner product) xếp hạng y như cosine; ORDER BY phải là
+    # đúng biểu thức `<#>` để dùng HNSW (halfvec_ip_ops), cosine distance = 1 - ip = 1 + (`<#>`)
+    qvec = bindparam("qvec", type_=Chunk.embedding.type)
+    neg_ip = Chunk.embedding.max_inner_product(qvec)
+
+    # chỉ lấy các cột cần dùng => không kéo cột embedding + không dựng ORM object cho mỗi row.
+    # Khi planner chọn HNSW, WHERE collection_id chỉ lọc trên ef_search ứng viên của index scan
+    # => collection nhỏ trong bảng lớn có thể thiếu kết quả; xem _CHAT_SESSION_SQL bên dưới
+    return (
+        select(
+            Chunk.id.label("chunk_id"),
+            Chunk.content,
+            Chunk.page,
+            Chunk.chunk_index,
+            Document.id.label("document_id"),
+            Document.filename,
+            (neg_ip + 1).label("distance"),
+        )
+        .join(Document, Document.id == Chunk.document_id)
+        .where(Chunk.collection_id == bindparam("collection_id"))
+        .order_by(neg_ip)
+        .limit(bindparam("top_k", type_=Integer))
+    )
+
+
+# build 1 lần: mọi giá trị đều là bind param => SQLAlchemy dùng lại compiled cache,
+# SQL text cố định => psycopg tự prepare statement sau vài lần execute (prepare_threshold),
+# vẫn plan theo giá trị param mỗi lần vì force_custom_plan (xem _CHAT_SESSION_SQL)
+_CHAT_STMT = _build_chat_stmt()
+
+# set_config(..., is_local=true) => chỉ áp dụng trong transaction của request.
+# force_custom_plan: planner luôn thấy giá trị collection_id => collection nhỏ chọn btree + sort (chính xác),
+# collection lớn mới đi HNSW (generic plan thì luôn HNSW + lọc sau => mất kết quả của collection nhỏ).
+# iterative_scan (pgvector 0.8+): HNSW quét tiếp tới khi đủ LIMIT rows thỏa WHERE, giữ đúng thứ tự
+_CHAT_SESSION_SQL = text(
+    "SELECT set_config('hnsw.ef_search', :ef_search, true), "
+    "set_config('plan_cache_mode', 'force_custom_plan', true)"
+)
+_CHAT_SESSION_SQL_ITERATIVE = text(
+    "SELECT set_config('hnsw.ef_search', :ef_search, true), "
+    "set_config('plan_cache_mode', 'force_custom_plan', true), "
+    "set_config('hnsw.iterative_scan', 'strict_order', true)"
+)
+
+
 class ChatRequest(BaseModel):
     question: str
     collection_id: str | None = "default"
     top_k: int | None = 4
+    # override hnsw.ef_search cho riêng request này (None => settings.RAG_EF_SEARCH), pgvector cho phép 1..1000
+    ef_search: int | None = Field(None, ge=1, le=1000)
 
 
 @router.post("/chat")
@@ -121,25 +177,32 @@ def chat(req: ChatRequest, db: Session = Depends(get_db)):
     collection_id = req.collection_id or "default"
     top_k = max(1, min(int(req.top_k or 4), 10))
 
+    ef_search = req.ef_search if req.ef_search is not None else settings.RAG_EF_SEARCH
+
     qvec = embed_query(q)
 
-    # Get both chunks + cosine distance for gating
-    dist = Chunk.embedding.cosine_distance(qvec).label("distance")
+    db.execute(
+        _CHAT_SESSION_SQL_ITERATIVE if pgvector_has_iterative_scan() else _CHAT_SESSION_SQL,
+        {"ef_search": str(ef_search)},
+    )
 
     rows = (
-        db.query(Chunk, Document, dist)
-        .join(Document, Document.id == Chunk.document_id)
-        .filter(Chunk.collection_id == collection_id)
-        .filter(Chunk.embedding.isnot(None))
-        .order_by(dist)
-        .limit(top_k)
+        db.execute(
+            _CHAT_STMT,
+            {
+                "qvec": qvec,
+                "collection_id": collection_id,
+                "top_k": top_k,
+            },
+        )
+        .mappings()
         .all()
     )
 
     if not rows:
         return {"answer": "Mình chưa tìm thấy dữ liệu phù hợp trong collection này.", "citations": []}
 
-    best_dist = float(rows[0][2])
+    best_dist = float(rows[0]["distance"])
     if best_dist > float(settings.RAG_MAX_COSINE_DISTANCE):
         return {
             "answer": "Mình chưa tìm thấy đoạn nào đủ liên quan trong tài liệu để trả lời câu hỏi này.",
@@ -148,17 +211,18 @@ def chat(req: ChatRequest, db: Session = Depends(get_db)):
 
     contexts: list[str] = []
     citations: list[dict] = []
-    for (chunk, doc, d) in rows:
-        contexts.append(chunk.content)
+    for r in rows:
+        content = r["content"]
+        contexts.append(content)
         citations.append(
             {
-                "chunk_id": chunk.id,
-                "document_id": doc.id,
-                "filename": doc.filename,
-                "page": chunk.page,
-                "chunk_index": chunk.chunk_index,
-                "distance": float(d),  # optional: giúp debug/tuning
-                "snippet": chunk.content[:240] + ("..." if len(chunk.content) > 240 else ""),
+                "chunk_id": r["chunk_id"],
+                "document_id": r["document_id"],
+                "filename": r["filename"],
+                "page": r["page"],
+                "chunk_index": r["chunk_index"],
+                "distance": float(r["distance"]),  # optional: giúp debug/tuning
+                "snippet": content[:240] + ("..." if len(content) > 240 else ""),
             }
         )
 
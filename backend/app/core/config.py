@@ -15,10 +15,24 @@ class Settings(BaseSettings):
 
     EMBED_MODEL_NAME: str = "intfloat/multilingual-e5-small"
     EMBED_DIM: int = 384
+    # số passage encode mỗi mini-batch (tránh OOM khi upload tài liệu lớn)
+    EMBED_BATCH_SIZE: int = 64
+    # FP16 trên CUDA / BF16 trên CPU có AVX512_BF16 (giảm băng thông weights, cosine gần như không đổi)
+    EMBED_HALF_PRECISION: bool = True
+    # CPU-only: encode bằng ONNX Runtime (optional, cần `pip install optimum[onnxruntime]`)
+    EMBED_USE_ONNX: bool = False
+    # nơi lưu model ONNX đã export (export 1 lần, các lần start sau load lại)
+    EMBED_ONNX_DIR: str = str(BASE_DIR / "onnx_cache")
+    # lúc startup, doc pending lâu hơn số phút này coi như bị ngắt (restart/crash) => đánh failed;
+    # doc mới hơn có thể đang được worker/replica khác xử lý nên giữ nguyên
+    INGEST_STALE_MINUTES: int = 60
 
     # RAG gating: nếu cosine distance của chunk tốt nhất > ngưỡng này => coi như "không đủ liên quan"
     # (cosine distance càng nhỏ càng giống)
     RAG_MAX_COSINE_DISTANCE: float = 0.35
 
+    # hnsw.ef_search mặc định cho /chat (pgvector default = 40); lớn hơn => recall cao hơn nhưng chậm hơn
+    RAG_EF_SEARCH: int = 100
+
 
 settings = Settings()
@@ -1,8 +1,31 @@
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 from sqlalchemy import String, Text, Integer, DateTime, func, ForeignKey, Index
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import HALFVEC
+from pgvector.utils import HalfVector
 from app.core.config import settings
 
+# tên index HNSW hiện tại + các tên cũ (opclass khác) cần drop khi startup
+ANN_INDEX_NAME = "ix_chunks_embedding_hnsw_ip"
+LEGACY_ANN_INDEX_NAMES = ("ix_chunks_embedding_hnsw", "ix_chunks_embedding_ivfflat")
+
+class BinaryHALFVEC(HALFVEC):
+    """
+    HALFVEC gốc luôn bind dạng text '[v1,v2,...]'. Bản này bind HalfVector (ndarray -> fp16,
+    không qua list Python) để psycopg gửi binary qua adapter register_vector (db/session.py).
+    """
+
+    cache_ok = True
+
+    def bind_processor(self, dialect):
+        def process(value):
+            if value is None or isinstance(value, HalfVector):
+                return value
+            value = HalfVector(value)
+            if self.dim is not None and value.dimensions() != self.dim:
+                raise ValueError(f"expected {self.dim} dimensions, not {value.dimensions()}")
+            return value
+        return process
+
 class Base(DeclarativeBase):
     pass
 
@@ -12,6 +35,9 @@ class Document(Base):
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
     collection_id: Mapped[str] = mapped_column(String(100), nullable=False, index=True, default="default")
     filename: Mapped[str] = mapped_column(String(255), nullable=False)
+    # pending => đang parse/chunk/embed ở background, ready => search được, failed => xem error
+    status: Mapped[str] = mapped_column(String(20), nullable=False, default="pending", server_default="ready")
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
 class Chunk(Base):
@@ -26,8 +52,19 @@ class Chunk(Base):
     page: Mapped[int | None] = mapped_column(Integer, nullable=True)
     chunk_index: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
 
-    embedding: Mapped[list[float] | None] = mapped_column(Vector(settings.EMBED_DIM), nullable=True)
+    # halfvec (pgvector 0.7+): 2 byte/chiều => bảng + graph HNSW nhỏ ~2x so với vector float32
+    embedding: Mapped[list[float]] = mapped_column(BinaryHALFVEC(settings.EMBED_DIM), nullable=False)
 
     created_at: Mapped[str] = mapped_column(DateTime(timezone=True), server_default=func.now())
 
 Index("ix_chunks_docid_chunkindex", Chunk.document_id, Chunk.chunk_index)
+
+# ANN index cho /chat: opclass phải khớp toán tử `<#>` (max_inner_product) thì planner mới dùng.
+# Vector đã normalize => inner product tương đương cosine nhưng bỏ được bước tính norm
+Index(
+    ANN_INDEX_NAME,
+    Chunk.embedding,
+    postgresql_using="hnsw",
+    postgresql_ops={"embedding": "halfvec_ip_ops"},
+    postgresql_with={"m": 24, "ef_construction": 128},
+)
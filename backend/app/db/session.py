@@ -1,8 +1,23 @@
-from sqlalchemy import create_engine
+from functools import lru_cache
+from pgvector.psycopg import register_vector
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker
 from app.core.config import settings
 
 engine = create_engine(settings.DATABASE_URL, pool_pre_ping=True)
+
+@event.listens_for(engine, "connect")
+def _register_pgvector(dbapi_connection, connection_record):
+    # adapter binary cho vector/halfvec (numpy, HalfVector) thay vì text '[v1,v2,...]'
+    register_vector(dbapi_connection)
+
+@lru_cache
+def pgvector_has_iterative_scan() -> bool:
+    # hnsw.iterative_scan có từ pgvector 0.8; bản cũ hơn set_config sẽ lỗi ("hnsw" là reserved prefix)
+    with engine.connect() as conn:
+        version = conn.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+    return version is not None and tuple(int(x) for x in version.split(".")[:2]) >= (0, 8)
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 def get_db():
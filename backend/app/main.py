@@ -1,8 +1,12 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.api.routes import router
-from app.db.models import Base
-from app.db.session import engine
+from app.api.routes import STORAGE_DIR, router
+from app.core.config import settings
+from app.db.models import LEGACY_ANN_INDEX_NAMES, Base, Chunk
+from app.db.session import engine, pgvector_has_iterative_scan
+from app.services.embeddings import warmup
+from app.services.parsing import shutdown_pool
+from sqlalchemy import text
 
 app = FastAPI(title="RAG KB Chatbot")
 
@@ -15,9 +19,85 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def _sync_embedding_column():
+    """
+    DB cũ có thể còn cột embedding khác dimension/type (vd. vector(1024), vector(384) trước khi
+    chuyển sang halfvec) => HNSW không tạo được; hoặc còn nullable.
+    Đưa cột về đúng type/NOT NULL khai báo trong models (theo settings.EMBED_DIM) trước khi tạo index.
+    """
+    expected = Chunk.__table__.c.embedding.type.compile(dialect=engine.dialect).lower()
+    with engine.begin() as conn:
+        row = conn.execute(
+            text(
+                "SELECT format_type(a.atttypid, a.atttypmod), a.attnotnull FROM pg_attribute a "
+                "WHERE a.attrelid = to_regclass('chunks') AND a.attname = 'embedding' AND NOT a.attisdropped"
+            )
+        ).first()
+        if row is None:
+            return
+        current, notnull = row
+        if not notnull:
+            # chunk không có embedding thì không search được => không cho phép nữa
+            conn.execute(text("DELETE FROM chunks WHERE embedding IS NULL"))
+            conn.execute(text("ALTER TABLE chunks ALTER COLUMN embedding SET NOT NULL"))
+        if current.lower() == expected:
+            return
+        # mọi index trên cột embedding (HNSW/IVFFLAT tự tạo theo README cũ, opclass vector_*_ops...)
+        # không rebuild được sang type mới => bỏ hết, on_startup tạo lại index khai báo trong models
+        index_names = conn.execute(
+            text(
+                "SELECT ic.relname FROM pg_index i "
+                "JOIN pg_class ic ON ic.oid = i.indexrelid "
+                "JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = ANY(i.indkey) "
+                "WHERE i.indrelid = to_regclass('chunks') AND a.attname = 'embedding'"
+            )
+        ).scalars().all()
+        for name in index_names:
+            conn.execute(text(f"DROP INDEX IF EXISTS {conn.dialect.identifier_preparer.quote(name)}"))
+        try:
+            conn.execute(text(f"ALTER TABLE chunks ALTER COLUMN embedding TYPE {expected}"))
+        except Exception as e:
+            raise RuntimeError(
+                f"chunks.embedding is {current} but models expect {expected}; "
+                f"existing vectors cannot be converted, re-index the documents ({e})"
+            ) from e
+
 @app.on_event("startup")
 def on_startup():
+    # tạo thư mục lưu file upload 1 lần, không mkdir lại mỗi request
+    STORAGE_DIR.mkdir(parents=True, exist_ok=True)
     # tạo tables cho nhanh (sau này bạn thích thì chuyển sang Alembic)
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        # ANN index cũ (opclass khác, vd. cosine) => bỏ trước khi đổi type cột / tạo index mới
+        for name in LEGACY_ANN_INDEX_NAMES:
+            conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+    _sync_embedding_column()
+    with engine.begin() as conn:
+        # documents cũ (trước khi có background ingest) đều đã index xong => ready
+        conn.execute(text("ALTER TABLE documents ADD COLUMN IF NOT EXISTS status VARCHAR(20) NOT NULL DEFAULT 'ready'"))
+        conn.execute(text("ALTER TABLE documents ADD COLUMN IF NOT EXISTS error TEXT"))
+        # BackgroundTasks chỉ nằm trong memory => doc pending quá lâu là bị ngắt giữa chừng (restart/crash),
+        # không ai xử lý tiếp => đánh failed để client biết cần upload lại.
+        # Chỉ đụng row cũ hơn INGEST_STALE_MINUTES: doc mới có thể thuộc worker/replica khác đang chạy
+        conn.execute(
+            text(
+                "UPDATE documents SET status = 'failed', "
+                "error = 'Indexing interrupted by server restart, please re-upload' "
+                "WHERE status = 'pending' AND created_at < now() - make_interval(mins => :stale_minutes)"
+            ),
+            {"stale_minutes": settings.INGEST_STALE_MINUTES},
+        )
+    # create_all không thêm index cho bảng đã tồn tại => tạo bù (vd. HNSW) cho DB cũ
+    for idx in Chunk.__table__.indexes:
+        idx.create(bind=engine, checkfirst=True)
+    # đọc version pgvector 1 lần (cache) thay vì ở /chat đầu tiên
+    pgvector_has_iterative_scan()
+    # load embedding model ngay lúc startup thay vì ở /chat hoặc /documents/upload đầu tiên
+    warmup()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    shutdown_pool()
 
 app.include_router(router)
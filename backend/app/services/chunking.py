@@ -1,5 +1,8 @@
+import re
 from typing import List, Tuple, Optional, Dict, Any
 
+_WS = re.compile(r"\s+")
+
 def chunk_pages(
     pages: List[Tuple[Optional[int], str]],
     chunk_chars: int = 1200,
@@ -9,25 +12,29 @@ def chunk_pages(
     global_idx = 0
 
     for page, text in pages:
-        text = " ".join(text.split())  # normalize whitespace
+        text = _WS.sub(" ", text).strip()  # normalize whitespace (1 pass, không tạo list token)
         if not text:
             continue
 
+        # tính (start, end) trước, chỉ cắt string 1 lần cho mỗi chunk ở cuối
+        offsets: List[Tuple[int, int]] = []
+        n = len(text)
         start = 0
-        while start < len(text):
-            end = min(len(text), start + chunk_chars)
-            content = text[start:end].strip()
-            if content:
-                chunks.append(
-                    {
-                        "page": page,
-                        "chunk_index": global_idx,
-                        "content": content,
-                    }
-                )
-                global_idx += 1
-            if end >= len(text):
+        while start < n:
+            end = min(n, start + chunk_chars)
+            # text đã normalize => biên chỉ có thể dính đúng 1 space, thay cho .strip() trên slice
+            s = start + 1 if text[start] == " " else start
+            e = end - 1 if end > s and text[end - 1] == " " else end
+            if e > s:
+                offsets.append((s, e))
+            if end >= n:
                 break
             start = max(0, end - overlap)
 
+        chunks.extend(
+            {"page": page, "chunk_index": global_idx + i, "content": text[s:e]}
+            for i, (s, e) in enumerate(offsets)
+        )
+        global_idx += len(offsets)
+
     return chunks
@@ -1,22 +1,114 @@
+import os
 from functools import lru_cache
-from typing import List
+from pathlib import Path
+from typing import List, Union
 import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
 from app.core.config import settings
 
+class _OnnxEncoder:
+    """
+    Model export sang ONNX Runtime (CPUExecutionProvider), expose encode() tối thiểu giống
+    SentenceTransformer: mean pooling theo attention mask + L2 normalize (như pooling của e5).
+    Export torch -> ONNX chỉ chạy lần đầu, lưu vào cache_dir; các lần start sau load thẳng từ đó.
+    """
+
+    def __init__(self, model_name: str, cache_dir: Path):
+        try:
+            from optimum.onnxruntime import ORTModelForFeatureExtraction
+        except ImportError as e:
+            raise RuntimeError("EMBED_USE_ONNX=true requires `pip install optimum[onnxruntime]`") from e
+        from transformers import AutoTokenizer
+
+        if (cache_dir / "model.onnx").exists():
+            self.tokenizer = AutoTokenizer.from_pretrained(cache_dir)
+            self.model = ORTModelForFeatureExtraction.from_pretrained(
+                cache_dir, export=False, provider="CPUExecutionProvider"
+            )
+            return
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            model_name, export=True, provider="CPUExecutionProvider"
+        )
+        cache_dir.mkdir(parents=True, exist_ok=True)
+        self.model.save_pretrained(cache_dir)
+        self.tokenizer.save_pretrained(cache_dir)
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.model.config.hidden_size
+
+    def encode(
+        self,
+        texts: List[str],
+        batch_size: int = 32,
+        normalize_embeddings: bool = True,
+    ) -> torch.Tensor:
+        if not texts:
+            return torch.empty(0, self.get_sentence_embedding_dimension())
+        # sort theo độ dài (như SentenceTransformer) => mỗi batch chỉ pad tới câu dài nhất trong batch
+        order = sorted(range(len(texts)), key=lambda i: -len(texts[i]))
+        out: List[torch.Tensor] = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            idx = order[start:start + batch_size]
+            batch = self.tokenizer(
+                [texts[i] for i in idx], padding=True, truncation=True, max_length=512, return_tensors="pt"
+            )
+            hidden = self.model(**batch).last_hidden_state
+            mask = batch["attention_mask"].unsqueeze(-1).to(hidden.dtype)
+            emb = (hidden * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            if normalize_embeddings:
+                emb = torch.nn.functional.normalize(emb, p=2, dim=1)
+            for j, i in enumerate(idx):
+                out[i] = emb[j]
+        return torch.stack(out)
+
 @lru_cache
-def _model() -> SentenceTransformer:
-    return SentenceTransformer(settings.EMBED_MODEL_NAME)
+def _model() -> Union[SentenceTransformer, _OnnxEncoder]:
+    torch.set_num_threads(os.cpu_count() or 1)
+    if torch.cuda.is_available():
+        torch.backends.cuda.matmul.allow_tf32 = True
+        torch.set_float32_matmul_precision("high")
+    if settings.EMBED_USE_ONNX:
+        # mỗi model 1 thư mục con => đổi EMBED_MODEL_NAME không load nhầm export cũ
+        cache_dir = Path(settings.EMBED_ONNX_DIR) / settings.EMBED_MODEL_NAME.replace("/", "__")
+        model = _OnnxEncoder(settings.EMBED_MODEL_NAME, cache_dir)
+    else:
+        model = SentenceTransformer(settings.EMBED_MODEL_NAME)
+    dim = model.get_sentence_embedding_dimension()
+    if dim != settings.EMBED_DIM:
+        raise RuntimeError(
+            f"{settings.EMBED_MODEL_NAME} produces {dim}-D vectors but EMBED_DIM={settings.EMBED_DIM}"
+        )
+    if settings.EMBED_HALF_PRECISION and not settings.EMBED_USE_ONNX:
+        if torch.cuda.is_available():
+            model = model.half()
+        elif getattr(torch.cpu, "_is_avx512_bf16_supported", lambda: False)():
+            model = model.to(dtype=torch.bfloat16)
+    return model
+
+def _encode(model: Union[SentenceTransformer, _OnnxEncoder], texts: List[str], **kwargs) -> np.ndarray:
+    if isinstance(model, SentenceTransformer):
+        # option riêng của SentenceTransformer (_OnnxEncoder luôn trả tensor, không có progress bar)
+        kwargs.update(convert_to_tensor=True, show_progress_bar=False)
+    with torch.inference_mode():
+        emb = model.encode(texts, normalize_embeddings=True, **kwargs)
+    # weights có thể là fp16/bf16 => ép về float32 trước khi lưu vào pgvector
+    return emb.float().cpu().numpy()
+
+def warmup() -> None:
+    """Load model + chạy 1 lần encode (init kernels/CUDA context) để request đầu không phải chờ."""
+    _encode(_model(), ["query: warmup"])
 
-def embed_passages(texts: List[str]) -> List[List[float]]:
+def embed_passages(texts: List[str]) -> np.ndarray:
+    """Trả về ma trận float32 [N, EMBED_DIM]; mỗi row được bind thẳng vào cột halfvec."""
     model = _model()
     prefixed = [f"passage: {t}" for t in texts]
-    emb = model.encode(prefixed, normalize_embeddings=True)
-    emb = np.asarray(emb, dtype=np.float32)
-    return emb.tolist()
+    # encode() tự sort theo độ dài => mỗi mini-batch chỉ pad tới câu dài nhất trong batch đó
+    return _encode(model, prefixed, batch_size=settings.EMBED_BATCH_SIZE)
 
-def embed_query(text: str) -> List[float]:
+def embed_query(text: str) -> np.ndarray:
     model = _model()
-    emb = model.encode([f"query: {text}"], normalize_embeddings=True)[0]
-    emb = np.asarray(emb, dtype=np.float32)
-    return emb.tolist()
+    # giữ ndarray float32 (không .tolist()) => psycopg gửi binary qua adapter pgvector
+    return _encode(model, [f"query: {text}"])[0]
@@ -1,74 +1,81 @@
 import re
-from typing import List, Optional
+from dataclasses import dataclass
+from typing import Dict, List, Optional
 
+# compile 1 lần lúc load module (không re.escape/format pattern mỗi lần gọi)
+_LABEL_RE = re.compile(r"(?i)\b(?P<label>backend|frontend|database|luồng dữ liệu|data flow)\b\s*:\s*")
+_WS_RE = re.compile(r"\s+")
+_LEAD_PUNCT_RE = re.compile(r"^[\s\-\•\,\;\:\.]+")
+_PORT_RE = re.compile(r"(?i)\bport\s*([0-9]{2,5})\b")
+_NUM_RE = re.compile(r"\b([0-9]{2,5})\b")
+_PARENS_PORT_RE = re.compile(r"\(\s*port\s*([0-9]{2,5})\s*\)", re.IGNORECASE)
+_CHAT_FIELDS_RE = re.compile(r"post\s*/chat.*?:\s*(question\s*,?\s*collection_id\s*,?\s*top_k)", re.IGNORECASE | re.DOTALL)
+_REFUND_RE = re.compile(r"(Hoàn tiền.*?\.)", re.IGNORECASE | re.DOTALL)
+_SUPPORT_RE = re.compile(r"(Thời gian phản hồi.*?\.)", re.IGNORECASE | re.DOTALL)
+# \r\n | \r => \n ; chuỗi space/tab/nbsp => 1 space (1 pass thay cho 4 lần replace + sub)
+_NORM_RE = re.compile(r"\r\n?|[ \t\u00a0]+")
 
-def _norm(s: str) -> str:
-    if not s:
-        return ""
-    s = s.replace("\u00a0", " ").replace("\r\n", "\n").replace("\r", "\n")
-    s = s.replace("\t", " ")
-    s = re.sub(r"[ \t]+", " ", s)
-    return s.strip()
 
+def _norm_repl(m: re.Match) -> str:
+    return "\n" if m.group(0)[0] == "\r" else " "
 
-def _combined(contexts: List[str]) -> str:
-    return _norm("\n".join([c or "" for c in contexts]))
 
+@dataclass
+class NormalizedCtx:
+    """Contexts đã gộp (bỏ trùng) + normalize đúng 1 lần, dùng chung cho mọi helper."""
 
-def _extract_between(label: str, text: str, next_labels: List[str]) -> Optional[str]:
-    """
-    Lấy value sau 'Label:' cho tới trước label kế tiếp.
-    Chỉ dùng những gì có trong contexts, không tự bịa thông tin.
-    """
-    text = _norm(text)
-    m = re.search(rf"(?i)\b{re.escape(label)}\b\s*:\s*", text)
-    if not m:
-        return None
+    text: str
 
-    tail = text[m.end():]
-    end = len(tail)
+    @classmethod
+    def from_contexts(cls, contexts: List[str]) -> "NormalizedCtx":
+        unique = dict.fromkeys(c for c in contexts if c)
+        return cls(_NORM_RE.sub(_norm_repl, "\n".join(unique)).strip())
 
-    for lb in next_labels:
-        m2 = re.search(rf"(?i)\b{re.escape(lb)}\b\s*:\s*", tail)
-        if m2:
-            end = min(end, m2.start())
 
-    val = tail[:end].strip()
-    val = re.sub(r"^[\s\-\•\,\;\:\.]+", "", val).strip()
-    val = re.sub(r"\s+", " ", val).strip()
-    if len(val) < 3:
-        return None
-    return val
+def _extract_labels(text: str) -> Dict[str, Optional[str]]:
+    """
+    Lấy value sau mỗi 'Label:' cho tới trước label kế tiếp (quét text đúng 1 lần).
+    Chỉ dùng lần xuất hiện đầu tiên của mỗi label, không tự bịa thông tin.
+    """
+    matches = list(_LABEL_RE.finditer(text))
+    out: Dict[str, Optional[str]] = {}
+    for i, m in enumerate(matches):
+        label = m.group("label").lower()
+        if label in out:
+            continue
+        end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+        val = text[m.end():end].strip()
+        val = _LEAD_PUNCT_RE.sub("", val).strip()
+        val = _WS_RE.sub(" ", val).strip()
+        out[label] = val if len(val) >= 3 else None
+    return out
 
 
-def _extract_arch(text: str) -> tuple[Optional[str], Optional[str], Optional[str]]:
-    labels = ["backend", "frontend", "database", "luồng dữ liệu", "data flow"]
-    backend = _extract_between("backend", text, labels)
-    frontend = _extract_between("frontend", text, labels)
-    database = _extract_between("database", text, labels)
-    return backend, frontend, database
+def _extract_arch(ctx: NormalizedCtx) -> tuple[Optional[str], Optional[str], Optional[str]]:
+    values = _extract_labels(ctx.text)
+    return values.get("backend"), values.get("frontend"), values.get("database")
 
 
 def _port_from(s: Optional[str]) -> Optional[str]:
     if not s:
         return None
-    m = re.search(r"(?i)\bport\s*([0-9]{2,5})\b", s)
+    m = _PORT_RE.search(s)
     if m:
         return m.group(1)
-    m = re.search(r"\b([0-9]{2,5})\b", s)
+    m = _NUM_RE.search(s)
     return m.group(1) if m else None
 
 
 def _clean_parens_port(s: str) -> str:
-    return re.sub(r"\(\s*port\s*([0-9]{2,5})\s*\)", r"port \1", s, flags=re.IGNORECASE)
+    return _PARENS_PORT_RE.sub(r"port \1", s)
 
 
-def _find_first(pattern: str, text: str) -> Optional[str]:
-    m = re.search(pattern, text, flags=re.IGNORECASE | re.DOTALL)
+def _find_first(pattern: re.Pattern, ctx: NormalizedCtx) -> Optional[str]:
+    m = pattern.search(ctx.text)
     if not m:
         return None
     out = (m.group(1) or "").strip()
-    out = re.sub(r"\s+", " ", out).strip()
+    out = _WS_RE.sub(" ", out).strip()
     return out if out else None
 
 
@@ -76,7 +83,7 @@ def _first_snippet(contexts: List[str], max_chars: int = 420) -> str:
     if not contexts:
         return ""
     s = (contexts[0] or "").strip()
-    s = re.sub(r"\s+", " ", s).strip()
+    s = _WS_RE.sub(" ", s).strip()
     if len(s) > max_chars:
         s = s[:max_chars].rstrip() + "..."
     return s
@@ -89,11 +96,11 @@ def build_fallback_answer(question: str, contexts: List[str]) -> str:
     - Không có thông tin trong contexts => nói rõ "không thấy trong tài liệu".
     """
     q = (question or "").strip().lower()
-    text = _combined(contexts)
+    ctx = NormalizedCtx.from_contexts(contexts)
 
     # 1) Kiến trúc
     if any(k in q for k in ["kiến trúc", "thành phần", "architecture", "components"]):
-        be, fe, db = _extract_arch(text)
+        be, fe, db = _extract_arch(ctx)
         if be or fe or db:
             parts = []
             if be:
@@ -108,7 +115,7 @@ def build_fallback_answer(question: str, contexts: List[str]) -> str:
 
     # 2) Port
     if "port" in q:
-        be, fe, db = _extract_arch(text)
+        be, fe, db = _extract_arch(ctx)
         p_be = _port_from(be)
         p_fe = _port_from(fe)
         p_db = _port_from(db)
@@ -135,21 +142,21 @@ def build_fallback_answer(question: str, contexts: List[str]) -> str:
 
     # 3) Endpoint /chat (nếu docs có)
     if "/chat" in q or "endpoint" in q:
-        fields = _find_first(r"post\s*/chat.*?:\s*(question\s*,?\s*collection_id\s*,?\s*top_k)", text)
+        fields = _find_first(_CHAT_FIELDS_RE, ctx)
         if fields:
             return "Theo tài liệu, POST /chat gồm: question, collection_id, top_k."
         return "Mình không thấy mô tả endpoint /chat trong các đoạn trích hiện có."
 
     # 4) Hoàn tiền
     if "hoàn tiền" in q:
-        refund = _find_first(r"(Hoàn tiền.*?\.)", text)
+        refund = _find_first(_REFUND_RE, ctx)
         if refund:
             return refund
         return "Mình không thấy nội dung chính sách hoàn tiền trong các đoạn trích hiện có."
 
     # 5) Hỗ trợ
     if any(k in q for k in ["phản hồi", "hỗ trợ", "support"]):
-        resp = _find_first(r"(Thời gian phản hồi.*?\.)", text)
+        resp = _find_first(_SUPPORT_RE, ctx)
         if resp:
             return resp
         return "Mình không thấy thời gian phản hồi hỗ trợ trong các đoạn trích hiện có."
@@ -0,0 +1,55 @@
+from pathlib import Path
+
+from sqlalchemy import insert
+
+from app.db.models import Document, Chunk
+from app.db.session import SessionLocal
+from app.services.parsing import parse_file
+from app.services.chunking import chunk_pages
+from app.services.embeddings import embed_passages
+
+
+def process_document(document_id: int, path: Path, collection_id: str) -> None:
+    """
+    Parse -> chunk -> embed -> insert Chunks cho 1 document đã upload, rồi set status.
+    Chạy ngoài request (BackgroundTasks) nên dùng session riêng, lỗi ghi vào Document.error.
+    """
+    db = SessionLocal()
+    try:
+        try:
+            pages = parse_file(path)
+            if not pages:
+                raise ValueError("No extractable text found")
+
+            chunks = chunk_pages(pages, chunk_chars=1200, overlap=200)
+            if not chunks:
+                raise ValueError("Chunking produced no chunks")
+
+            texts = [c["content"] for c in chunks]
+            vectors = embed_passages(texts)
+
+            # bulk INSERT (executemany, psycopg3 gửi theo pipeline) thay vì flush từng Chunk object
+            db.execute(
+                insert(Chunk),
+                [
+                    {
+                        "document_id": document_id,
+                        "collection_id": collection_id,
+                        "content": c["content"],
+                        "page": c["page"],
+                        "chunk_index": c["chunk_index"],
+                        "embedding": vectors[i],  # view 1 row của ndarray, không copy ra list
+                    }
+                    for i, c in enumerate(chunks)
+                ],
+            )
+            db.query(Document).filter(Document.id == document_id).update({"status": "ready", "error": None})
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            db.query(Document).filter(Document.id == document_id).update(
+                {"status": "failed", "error": str(e)}
+            )
+            db.commit()
+    finally:
+        db.close()
@@ -1,21 +1,97 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
 from typing import List, Tuple, Optional
 
 from pypdf import PdfReader
 import docx
 
+# PDF ít trang thì chi phí spawn process > lợi ích => parse tuần tự
+_PARALLEL_MIN_PAGES = 16
+_MAX_WORKERS = min(8, os.cpu_count() or 1)
+
+# pool dùng chung cho cả process, tạo lazy. "spawn" => worker là interpreter mới, không fork
+# process uvicorn đang chạy nhiều thread (torch, BackgroundTasks) và không mang theo model
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=_MAX_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def _discard_pool(pool: ProcessPoolExecutor) -> None:
+    # worker chết (OOM/segfault) => pool bị broken vĩnh viễn, bỏ đi để lần sau _get_pool() tạo pool mới.
+    # Chỉ reset nếu _pool vẫn là pool hỏng này (thread khác có thể đã thay pool mới)
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool() -> None:
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def _extract_pages(reader: PdfReader, start: int, stop: int) -> List[Tuple[Optional[int], str]]:
+    pages: List[Tuple[Optional[int], str]] = []
+    for i in range(start, stop):
+        text = reader.pages[i].extract_text() or ""
+        text = text.strip()
+        if text:
+            pages.append((i + 1, text))
+    return pages
+
+
+def _extract_range(path: str, start: int, stop: int) -> List[Tuple[Optional[int], str]]:
+    # chạy trong worker process: mỗi worker tự mở reader riêng (PdfReader không thread/process-safe)
+    with open(path, "rb") as fh:
+        return _extract_pages(PdfReader(fh, strict=False), start, stop)
+
+
+def _parse_pdf(path: Path) -> List[Tuple[Optional[int], str]]:
+    # truyền file object (không phải path) => pypdf seek trên file thay vì đọc cả file vào BytesIO
+    with path.open("rb") as fh:
+        reader = PdfReader(fh, strict=False)
+        n = len(reader.pages)
+        if n < _PARALLEL_MIN_PAGES or _MAX_WORKERS < 2:
+            return _extract_pages(reader, 0, n)
+
+    # extract_text() là pure Python (giữ GIL) => dùng process pool, chia trang thành các đoạn liên tiếp.
+    # Reader ở trên chỉ để đếm trang (page tree, chưa decode content), mỗi worker mở lại file:
+    # chấp nhận overhead parse xref/page tree lặp lại, nhỏ so với extract_text() cả PDF
+    step = -(-n // _MAX_WORKERS)
+    ranges = [(start, min(n, start + step)) for start in range(0, n, step)]
+    pool = _get_pool()
+    try:
+        parts = pool.map(_extract_range, [str(path)] * len(ranges), *zip(*ranges))
+        return [page for part in parts for page in part]
+    except BrokenProcessPool:
+        # không retry trên pool mới: cùng PDF có thể làm worker chết lần nữa => parse tuần tự
+        _discard_pool(pool)
+        with path.open("rb") as fh:
+            return _extract_pages(PdfReader(fh, strict=False), 0, n)
+
+
 def parse_file(path: Path) -> List[Tuple[Optional[int], str]]:
     ext = path.suffix.lower()
 
     if ext == ".pdf":
-        reader = PdfReader(str(path))
-        pages: List[Tuple[Optional[int], str]] = []
-        for i, p in enumerate(reader.pages, start=1):
-            text = p.extract_text() or ""
-            text = text.strip()
-            if text:
-                pages.append((i, text))
-        return pages
+        return _parse_pdf(path)
 
     if ext == ".docx":
         d = docx.Document(str(path))
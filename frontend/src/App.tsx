@@ -19,7 +19,8 @@ type Citation = {
   distance?: number; // backend gửi optional để debug/tuning
 };
 
-type DocItem = { id: number; filename: string };
+type DocItem = { id: number; filename: string; status?: string };
+type DocStatus = DocItem & { status: string; error?: string | null };
 type ChatMsg =
   | { id: string; role: "user"; content: string; createdAt: number }
   | {
@@ -222,6 +223,60 @@ export default function App() {
     };
   }, [docsUrl]);
 
+  // Poll docs đang index ở background (status=pending) tới khi ready/failed
+  const pendingIds = useMemo(
+    () =>
+      docs
+        .filter((d) => d.status === "pending")
+        .map((d) => d.id)
+        .join(","),
+    [docs]
+  );
+
+  useEffect(() => {
+    if (!pendingIds) return;
+    let alive = true;
+    const run = async () => {
+      const ids = pendingIds.split(",").map(Number);
+      const results = await Promise.all(
+        ids.map(async (id): Promise<DocStatus | null> => {
+          try {
+            const res = await fetch(`${API_URL}/documents/${id}`);
+            const data = await safeJson(res);
+            return res.ok ? data : null;
+          } catch {
+            return null;
+          }
+        })
+      );
+      if (!alive) return;
+      const done = results.filter(
+        (r): r is DocStatus => r !== null && r.status !== "pending"
+      );
+      if (done.length === 0) return;
+
+      const byId = new Map(done.map((r) => [r.id, r]));
+      setDocs((prev) =>
+        prev.map((d) => {
+          const r = byId.get(d.id);
+          return r ? { ...d, status: r.status } : d;
+        })
+      );
+      for (const r of done) {
+        if (r.status === "failed") {
+          setToast({ kind: "err", text: `Indexing failed: ${r.filename} (${r.error || "unknown error"})` });
+        } else {
+          setToast({ kind: "ok", text: `Indexed: ${r.filename}` });
+        }
+      }
+    };
+    const t = window.setInterval(run, 2000);
+    return () => {
+      alive = false;
+      window.clearInterval(t);
+    };
+  }, [pendingIds]);
+
   // Keep chat scrolled to bottom on new messages
   useEffect(() => {
     const el = chatScrollRef.current;
@@ -257,12 +312,15 @@ export default function App() {
       if (!res.ok) throw new Error(data?.detail || "Upload failed");
 
       setUploadResult(
-        `Indexed: ${data.filename} | chunks: ${data.chunks_indexed} | doc_id: ${data.document_id}`
+        `Queued: ${data.filename} | status: ${data.status} | doc_id: ${data.document_id}`
       );
-      setToast({ kind: "ok", text: "Upload & indexing done" });
+      setToast({ kind: "ok", text: "Upload done, indexing in background" });
 
       // optimistic refresh docs list
-      setDocs((prev) => [{ id: data.document_id, filename: data.filename }, ...prev]);
+      setDocs((prev) => [
+        { id: data.document_id, filename: data.filename, status: data.status },
+        ...prev,
+      ]);
 
       // clear file
       setFile(null);
@@ -557,7 +615,10 @@ export default function App() {
                         <div className="truncate text-sm font-medium text-gray-900">
                           {d.filename}
                         </div>
-                        <div className="text-xs text-gray-500">doc_id: {d.id}</div>
+                        <div className="text-xs text-gray-500">
+                          doc_id: {d.id}
+                          {d.status && d.status !== "ready" ? ` · ${d.status}` : ""}
+                        </div>
                       </div>
                       <button
                         onClick={() => copy(d.filename)}